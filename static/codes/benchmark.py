@@ -0,0 +1,110 @@
+"""
+Benchmark of the routes to P(D|M) in `modelposterior.py`: prior samples by
+sequential order, reordering or Gibbs sampling, posterior samples with
+Chib's identity, bridge sampling from posterior samples, and
+exact polynomial integration.
+
+Every route is run for each model, sample size and number of groups K,
+recording wall and CPU time, peak memory, samples per second and the
+absolute error of log P(D|M) against the exact value. The results are
+saved as JSON to compare estimators by error per CPU second and to catch
+regressions, e.g.
+
+    python benchmark.py --sizes 10000 100000 --K 5 8 --out bench.json
+"""
+import numpy as np
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+from modelposterior import (exactLogEvidence, generatePosteriorSample, generatePriorSample, getModel,
+                            kdeMode, logBridgeEvidence, logChibEvidence, logPriorEvidence)
+
+routes = ['sequential', 'reorder', 'gibbs', 'chib', 'bridge', 'exact']
+
+def syntheticData(K, n = 10, seed = 0):
+    """
+    K groups of `n` trials each, with success probabilities rising from 0.1
+    to 0.6; for K = 5 the data of the report are used instead.
+    """
+    if K == 5: return [(0,3),(1,6),(4,12),(3,6),(0,0)]
+    rng = np.random.default_rng(seed)
+    return [(int(y), n) for y in rng.binomial(n, np.linspace(0.1, 0.6, K))]
+
+def evaluateRoute(model, route, size, D, rng):
+    if route == 'exact':
+        return exactLogEvidence(model, D)
+    elif route == 'chib':
+        PData = generatePosteriorSample(model, size, D, rng=rng)
+        return logChibEvidence(model, PData, kdeMode(PData), D)
+    elif route == 'bridge':
+        PPrior = generatePriorSample(model, 'reorder', size, rng=rng)
+        return logBridgeEvidence(model, generatePosteriorSample(model, size, D, rng=rng), D, PPrior, rng=rng)[0]
+    else:
+        return logPriorEvidence(generatePriorSample(model, route, size, rng=rng), D)
+
+def benchRoute(model, route, size, D, seed = None):
+    """
+    Run one route and return its log P(D|M) with wall time, CPU time and
+    peak traced memory in bytes. Tracing slows allocation-heavy loops, so
+    the peak comes from a second, traced run on the same stream.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    logPDGM = evaluateRoute(model, route, size, D, np.random.default_rng(seed))
+    wall, cpu = time.perf_counter()-wall, time.process_time()-cpu
+    tracemalloc.start()
+    evaluateRoute(model, route, size, D, np.random.default_rng(seed))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return logPDGM, wall, cpu, peak
+
+def runBenchmark(models = (1,2,3), routes = routes, sizes = (100000,), Ks = (5,), repeats = 1, seed = 0):
+    """A list with one record per (K, model, route, size, repeat)."""
+    seeds = np.random.SeedSequence(seed)
+    # load the lazily imported scipy modules outside of the timings
+    evaluateRoute(1, 'chib', 10, syntheticData(5), np.random.default_rng(seed))
+    records = []
+    for K in Ks:
+        D = syntheticData(K)
+        for number in models:
+            model = getModel(number, K)
+            exact = exactLogEvidence(model, D)
+            for route in routes:
+                for size in ([None] if route == 'exact' else sizes):
+                    for repeat in range(repeats):
+                        logPDGM, wall, cpu, peak = benchRoute(model, route, size, D, seeds.spawn(1)[0])
+                        records.append({
+                            'model': number, 'route': route, 'K': K, 'size': size, 'repeat': repeat,
+                            'wall': wall, 'cpu': cpu, 'peakMemory': peak,
+                            'samplesPerSec': None if route == 'exact' else size/wall,
+                            'logEvidence': float(logPDGM), 'exactLogEvidence': exact,
+                            'absLogError': abs(float(logPDGM) - exact),
+                        })
+    return records
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmark the P(D|M) routes of modelposterior.py.")
+    parser.add_argument('--models', '-M', type=int, nargs='+', choices=(1,2,3), default=[1,2,3])
+    parser.add_argument('--routes', nargs='+', choices=routes, default=routes)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--K', type=int, nargs='+', default=[5])
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    records = runBenchmark(args.models, args.routes, args.sizes, args.K, args.repeats, args.seed)
+    print(f"{'K':>3} {'M':>2} {'route':>10} {'size':>9} {'wall s':>9} {'peak MB':>9} {'samples/s':>11} {'|log err|':>10}")
+    for r in records:
+        rate = f"{r['samplesPerSec']:11.0f}" if r['samplesPerSec'] else f"{'':>11}"
+        print(f"{r['K']:>3} {r['model']:>2} {r['route']:>10} {r['size'] or '':>9} {r['wall']:9.4f} {r['peakMemory']/2**20:9.1f} {rate} {r['absLogError']:10.2e}")
+    if args.out is not None:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args)}
+        with open(args.out, 'w') as f:
+            json.dump({'meta': meta, 'records': records}, f, indent=1)
+
+if __name__ == "__main__":
+    main()